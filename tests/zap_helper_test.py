@@ -66,7 +66,8 @@ class ZAPHelperTestCase(unittest.TestCase):
             self.zap_helper.start()
 
         expected_command = shlex.split('{} -daemon -port 8090'.format(executable))
-        popen_mock.assert_called_with(expected_command, cwd='', stderr=subprocess.STDOUT, stdout=file_open_mock())
+        popen_mock.assert_called_with(expected_command, cwd='', stderr=subprocess.STDOUT,
+                                      stdout=file_open_mock(), close_fds=True)
 
     @patch('platform.system')
     @patch('subprocess.Popen')
@@ -91,7 +92,33 @@ class ZAPHelperTestCase(unittest.TestCase):
             self.zap_helper.start(options=extra_options)
 
         expected_command = shlex.split('zap.sh -daemon -port 8090 {0}'.format(extra_options))
-        popen_mock.assert_called_with(expected_command, cwd='', stderr=subprocess.STDOUT, stdout=file_open_mock())
+        popen_mock.assert_called_with(expected_command, cwd='', stderr=subprocess.STDOUT,
+                                      stdout=file_open_mock(), close_fds=True)
+
+    @patch('platform.system')
+    @patch('subprocess.Popen')
+    @patch('os.path.isfile')
+    def test_start_without_log_file(self, isfile_mock, popen_mock, platform_mock):
+        """Test starting the ZAP daemon without writing a log file."""
+        def is_running_result():
+            """Used to mock the result of ZAPHelper.is_running."""
+            if self.zap_helper.is_running.call_count > 1:
+                return True
+
+            return False
+
+        self.zap_helper.is_running = Mock(side_effect=is_running_result)
+        platform_mock.return_value = 'Linux'
+        isfile_mock.return_value = True
+
+        file_open_mock = mock_open()
+        with patch('zapcli.zap_helper.open', file_open_mock, create=True):
+            self.zap_helper.start(log_to_file=False)
+
+        self.assertFalse(file_open_mock.called)
+        expected_command = shlex.split('zap.sh -daemon -port 8090')
+        popen_mock.assert_called_with(expected_command, cwd='', stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL, close_fds=True)
 
     @patch('platform.system')
     @patch('subprocess.Popen')
@@ -166,7 +193,7 @@ class ZAPHelperTestCase(unittest.TestCase):
     @responses.activate
     def test_is_running(self):
         """Test the check if ZAP is running."""
-        responses.add(responses.GET, 'http://127.0.0.1:8090',
+        responses.add(responses.HEAD, 'http://127.0.0.1:8090',
                       adding_headers={'Access-Control-Allow-Headers': 'ZAP-Header'})
 
         result = self.zap_helper.is_running()
@@ -176,7 +203,7 @@ class ZAPHelperTestCase(unittest.TestCase):
     @responses.activate
     def test_is_not_running(self):
         """Test the check if ZAP is running when it isn't."""
-        responses.add(responses.GET, 'http://127.0.0.1:8090',
+        responses.add(responses.HEAD, 'http://127.0.0.1:8090',
                       body=ConnectionError('[Errno 111] Connection refused'))
 
         result = self.zap_helper.is_running()
@@ -186,11 +213,37 @@ class ZAPHelperTestCase(unittest.TestCase):
     @responses.activate
     def test_is_not_running_error(self):
         """Test that an exception is raised when something else is listening on the port set for ZAP."""
-        responses.add(responses.GET, 'http://127.0.0.1:8090')
+        responses.add(responses.HEAD, 'http://127.0.0.1:8090')
 
         with self.assertRaises(ZAPError):
             self.zap_helper.is_running()
 
+    def test_api_request_uses_pooled_session(self):
+        """Test that API client requests go through the pooled session."""
+        helper = zap_helper.ZAPHelper(api_key='secret-key')
+        response_mock = MagicMock()
+        response_mock.json.return_value = {'scanners': []}
+        helper._session.request = Mock(return_value=response_mock)
+
+        helper.zap.ascan.scanners()
+
+        self.assertTrue(helper._session.request.called)
+        args, kwargs = helper._session.request.call_args
+        self.assertEqual(args[0], 'GET')
+        self.assertTrue(args[1].startswith('http://zap/'))
+        self.assertEqual(kwargs['headers'], {'X-ZAP-API-Key': 'secret-key'})
+        self.assertEqual(kwargs['proxies'],
+                         {'http': 'http://127.0.0.1:8090', 'https': 'http://127.0.0.1:8090'})
+
+    def test_api_request_rejects_non_api_url(self):
+        """Test that the pooled request shortcut still rejects non-API URLs."""
+        self.zap_helper._session.request = Mock()
+
+        with self.assertRaises(ValueError):
+            self.zap_helper.zap._request_api('http://example.com/')
+
+        self.assertFalse(self.zap_helper._session.request.called)
+
     @patch('zapv2.ZAPv2.urlopen')
     def test_open_url(self, urlopen_mock):
         """Test opening a URL through ZAP."""
@@ -414,6 +467,48 @@ class ZAPHelperTestCase(unittest.TestCase):
 
         self.assertEqual(result, expected_result)
 
+    @patch('zapv2.ascan.scanners')
+    def test_enabled_scanner_ids_cached(self, scanners_mock):
+        """Test that repeat enabled scanner lookups reuse the cached result."""
+        scanners_mock.return_value = [{'id': '6', 'enabled': 'true'}]
+
+        first = self.zap_helper.enabled_scanner_ids()
+        second = self.zap_helper.enabled_scanner_ids()
+
+        self.assertEqual(scanners_mock.call_count, 1)
+        self.assertEqual(first, second)
+
+    @patch('zapv2.ascan.scanners')
+    def test_enabled_scanner_ids_returns_copy(self, scanners_mock):
+        """Test that mutating a returned list does not corrupt the cache."""
+        scanners_mock.return_value = [{'id': '6', 'enabled': 'true'}]
+
+        result = self.zap_helper.enabled_scanner_ids()
+        result.append('50000')
+
+        self.assertEqual(self.zap_helper.enabled_scanner_ids(), ['6'])
+
+    @data(
+        ('enable_scanners_by_ids', (['40012'],)),
+        ('disable_scanners_by_ids', (['40012'],)),
+        ('enable_scanners_by_group', ('all',)),
+        ('disable_scanners_by_group', ('all',)),
+        ('set_enabled_scanners', (['40012'],)),
+        ('enable_policies_by_ids', (['0'],)),
+    )
+    @unpack
+    def test_enabled_scanner_ids_invalidated(self, method, args):
+        """Test that scanner and policy changes force a refetch of the enabled scanners."""
+        ascan_mock = MagicMock()
+        ascan_mock.scanners.return_value = [{'id': '6', 'enabled': 'true'}]
+        self.zap_helper.zap.ascan = ascan_mock
+
+        self.zap_helper.enabled_scanner_ids()
+        getattr(self.zap_helper, method)(*args)
+        self.zap_helper.enabled_scanner_ids()
+
+        self.assertEqual(ascan_mock.scanners.call_count, 2)
+
     @patch('zapv2.ascan.enable_scanners')
     def test_enable_scanners_by_group(self, ascan_mock):
         """Test enabling a scanners by group name."""
@@ -461,9 +556,17 @@ class ZAPHelperTestCase(unittest.TestCase):
         self.zap_helper.enable_scanners(['xss', '0', '50000'])
 
         self.assertFalse(enable_all_mock.called)
-        self.assertEqual(enable_mock.call_count, 2)
-        enable_mock.assert_any_call(','.join(self.zap_helper.scanner_group_map['xss']))
-        enable_mock.assert_any_call('0,50000')
+        self.assertEqual(enable_mock.call_count, 1)
+        enable_mock.assert_called_with(','.join(self.zap_helper.scanner_group_map['xss'] + ['0', '50000']))
+
+    @patch('zapv2.ascan.enable_all_scanners')
+    @patch('zapv2.ascan.enable_scanners')
+    def test_enable_scanners_all(self, enable_mock, enable_all_mock):
+        """Test that enabling the all group takes precedence over other scanners."""
+        self.zap_helper.enable_scanners(['all', 'xss', '50000'])
+
+        self.assertTrue(enable_all_mock.called)
+        self.assertFalse(enable_mock.called)
 
     @patch('zapv2.ascan.enable_all_scanners')
     @patch('zapv2.ascan.enable_scanners')
@@ -499,9 +602,8 @@ class ZAPHelperTestCase(unittest.TestCase):
 
         self.assertTrue(disable_mock.called)
         self.assertFalse(enable_all_mock.called)
-        self.assertEqual(enable_mock.call_count, 2)
-        enable_mock.assert_any_call(','.join(self.zap_helper.scanner_group_map['xss']))
-        enable_mock.assert_any_call('0,50000')
+        self.assertEqual(enable_mock.call_count, 1)
+        enable_mock.assert_called_with(','.join(self.zap_helper.scanner_group_map['xss'] + ['0', '50000']))
 
     @patch('zapv2.ascan.disable_all_scanners')
     @patch('zapv2.ascan.enable_all_scanners')
@@ -4,6 +4,10 @@ Helper methods to extend and wrap the ZAP API client.
 .. moduleauthor:: Daniel Grunwell (grunny)
 """
 
+import concurrent.futures
+import functools
+import logging
+import operator
 import os
 import platform
 import re
@@ -13,6 +17,7 @@ import time
 from six import binary_type
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 from zapv2 import ZAPv2
 
@@ -20,6 +25,15 @@ from zapcli.exceptions import ZAPError
 from zapcli.log import console
 
 
+_DIGITS_RE = re.compile(r'\A\d+\Z')
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_regex(pattern):
+    """Compile a regex pattern, caching the result for repeated patterns."""
+    return re.compile(pattern)
+
+
 class ZAPHelper(object):
     """ZAPHelper class for wrapping the ZAP API client."""
 
@@ -37,6 +51,9 @@ class ZAPHelper(object):
         'xss_persistent': ['40014', '40016', '40017'],
     }
 
+    _scanner_groups = frozenset(['all'] + list(scanner_group_map))
+    _scanner_group_csv = {group: ','.join(ids) for group, ids in scanner_group_map.items()}
+
     timeout = 60
     _status_check_sleep = 10
 
@@ -46,23 +63,34 @@ class ZAPHelper(object):
         self.zap_path = zap_path
         self.port = port
         self.proxy_url = '{0}:{1}'.format(url, self.port)
-        self.zap = ZAPv2(proxies={'http': self.proxy_url, 'https': self.proxy_url}, apikey=api_key)
+        self._session = requests.Session()
+        # ZAP runs on the loopback interface, so skip the per-request
+        # environment lookup for proxy and auth settings.
+        self._session.trust_env = False
+        self._session.mount('http://', HTTPAdapter(pool_maxsize=10, max_retries=0))
+        zap_proxies = {'http': self.proxy_url, 'https': self.proxy_url}
+        self.zap = ZAPv2(proxies=zap_proxies, apikey=api_key)
+        self._pool_zap_client(api_key, zap_proxies)
         self.api_key = api_key
         self.log_path = log_path
         self.logger = logger or console
+        self._executor = None
+        self._scanner_state_epoch = 0
+        self._enabled_scanner_cache = None
 
     @property
     def scanner_groups(self):
         """Available scanner groups."""
-        return ['all'] + list(self.scanner_group_map.keys())
+        return sorted(self._scanner_groups)
 
-    def start(self, options=None):
+    def start(self, options=None, log_to_file=True):
         """Start the ZAP Daemon."""
         if self.is_running():
             self.logger.warn('ZAP is already running on port {0}'.format(self.port))
             return
 
-        if platform.system() == 'Windows' or platform.system().startswith('CYGWIN'):
+        system = platform.system()
+        if system == 'Windows' or system.startswith('CYGWIN'):
             executable = 'zap.bat'
         else:
             executable = 'zap.sh'
@@ -78,17 +106,27 @@ class ZAPHelper(object):
             extra_options = shlex.split(options)
             zap_command += extra_options
 
-        if self.log_path is None:
-            log_path = os.path.join(self.zap_path, 'zap.log')
-        else:
-            log_path = os.path.join(self.log_path, 'zap.log')
-
         self.logger.debug('Starting ZAP process with command: {0}.'.format(' '.join(zap_command)))
-        self.logger.debug('Logging to {0}'.format(log_path))
-        with open(log_path, 'w+') as log_file:
+
+        if log_to_file:
+            if self.log_path is None:
+                log_path = os.path.join(self.zap_path, 'zap.log')
+            else:
+                log_path = os.path.join(self.log_path, 'zap.log')
+
+            self.logger.debug('Logging to {0}'.format(log_path))
+            log_file = open(log_path, 'wb', buffering=0)
+            try:
+                subprocess.Popen(
+                    zap_command, cwd=self.zap_path, stdout=log_file,
+                    stderr=subprocess.STDOUT, close_fds=True)
+            finally:
+                # The child process holds its own duplicate of the descriptor.
+                log_file.close()
+        else:
             subprocess.Popen(
-                zap_command, cwd=self.zap_path, stdout=log_file,
-                stderr=subprocess.STDOUT)
+                zap_command, cwd=self.zap_path, stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL, close_fds=True)
 
         self.wait_for_zap(self.timeout)
 
@@ -104,25 +142,69 @@ class ZAPHelper(object):
         self.zap.core.shutdown()
 
         timeout_time = time.time() + self.timeout
+        delay = 0.25
         while self.is_running():
             if time.time() > timeout_time:
                 raise ZAPError('Timed out waiting for ZAP to shutdown.')
-            time.sleep(2)
+            time.sleep(delay)
+            delay = min(delay * 1.5, 2)
 
         self.logger.debug('ZAP shutdown successfully.')
 
     def wait_for_zap(self, timeout):
         """Wait for ZAP to be ready to receive API calls."""
         timeout_time = time.time() + timeout
+        delay = 0.25
         while not self.is_running():
             if time.time() > timeout_time:
                 raise ZAPError('Timed out waiting for ZAP to start.')
-            time.sleep(2)
+            time.sleep(delay)
+            delay = min(delay * 1.5, 2)
+
+    def _pool_zap_client(self, api_key, proxies):
+        """
+        Route the API client's requests through the pooled session.
+
+        The client's request shortcut opens a throwaway requests.Session per
+        API call, so replace it on the instance with one bound to the shared
+        session to keep the keep-alive connections to the daemon.
+        """
+        if not hasattr(self.zap, '_request_api'):
+            return
+
+        session = self._session
+        headers = None
+        if api_key is not None:
+            headers = {'X-ZAP-API-Key': api_key}
+
+        def _request_api(url, query=None, method='GET', body=None):
+            """Make an API request on the pooled session."""
+            if not url.startswith('http://zap/'):
+                # Only allow requests to the API so that we never leak the apikey
+                raise ValueError('A non ZAP API url was specified ' + url)
+
+            return session.request(method, url, params=query, data=body,
+                                   headers=headers, proxies=proxies, verify=False)
+
+        self.zap._request_api = _request_api  # pylint: disable=protected-access
+
+    @property
+    def _api_executor(self):
+        """Thread pool used to dispatch independent API calls concurrently."""
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=3)
+        return self._executor
+
+    def close(self):
+        """Close the session used to check whether ZAP is running."""
+        if self._executor is not None:
+            self._executor.shutdown()
+        self._session.close()
 
     def is_running(self):
         """Check if ZAP is running."""
         try:
-            result = requests.get(self.proxy_url)
+            result = self._session.head(self.proxy_url, timeout=2)
         except RequestException:
             return False
 
@@ -156,9 +238,13 @@ class ZAPHelper(object):
 
         self.logger.debug('Started spider with ID {0}...'.format(scan_id))
 
-        while int(self.zap.spider.status()) < 100:
-            self.logger.debug('Spider progress %: {0}'.format(self.zap.spider.status()))
-            time.sleep(self._status_check_sleep)
+        delay = min(0.25, self._status_check_sleep)
+        status = int(self.zap.spider.status())
+        while status < 100:
+            self.logger.debug('Spider progress %: {0}'.format(status))
+            time.sleep(delay)
+            delay = min(delay * 1.5, self._status_check_sleep)
+            status = int(self.zap.spider.status())
 
         self.logger.debug('Spider #{0} completed'.format(scan_id))
 
@@ -183,9 +269,13 @@ class ZAPHelper(object):
 
         self.logger.debug('Started scan with ID {0}...'.format(scan_id))
 
-        while int(self.zap.ascan.status()) < 100:
-            self.logger.debug('Scan progress %: {0}'.format(self.zap.ascan.status()))
-            time.sleep(self._status_check_sleep)
+        delay = min(0.25, self._status_check_sleep)
+        status = int(self.zap.ascan.status())
+        while status < 100:
+            self.logger.debug('Scan progress %: {0}'.format(status))
+            time.sleep(delay)
+            delay = min(delay * 1.5, self._status_check_sleep)
+            status = int(self.zap.ascan.status())
 
         self.logger.debug('Scan #{0} completed'.format(scan_id))
 
@@ -203,35 +293,47 @@ class ZAPHelper(object):
 
     def alerts(self, alert_level='High'):
         """Get a filtered list of alerts at the given alert level, and sorted by alert level."""
-        alerts = self.zap.core.alerts()
-        alert_level_value = self.alert_levels[alert_level]
+        alert_levels = self.alert_levels
+        alert_level_value = alert_levels[alert_level]
 
-        alerts = sorted((a for a in alerts if self.alert_levels[a['risk']] >= alert_level_value),
-                        key=lambda k: self.alert_levels[k['risk']], reverse=True)
+        pairs = [(alert_levels[alert['risk']], alert) for alert in self.zap.core.alerts()]
+        pairs = [pair for pair in pairs if pair[0] >= alert_level_value]
+        pairs.sort(key=operator.itemgetter(0), reverse=True)
 
-        return alerts
+        return [alert for _, alert in pairs]
+
+    def _invalidate_scanner_cache(self):
+        """Mark the cached enabled-scanner list as stale."""
+        self._scanner_state_epoch += 1
 
     def enabled_scanner_ids(self):
         """Retrieves a list of currently enabled scanners."""
-        enabled_scanners = []
-        scanners = self.zap.ascan.scanners()
+        cached = self._enabled_scanner_cache
+        if cached is not None and cached[0] == self._scanner_state_epoch:
+            return list(cached[1])
 
-        for scanner in scanners:
-            if scanner['enabled'] == 'true':
-                enabled_scanners.append(scanner['id'])
+        scanners = self.zap.ascan.scanners()
+        enabled_scanners = [scanner['id'] for scanner in scanners if scanner['enabled'] == 'true']
+        self._enabled_scanner_cache = (self._scanner_state_epoch, enabled_scanners)
 
-        return enabled_scanners
+        return list(enabled_scanners)
 
     def enable_scanners_by_ids(self, scanner_ids):
         """Enable a list of scanner IDs."""
-        scanner_ids = ','.join(scanner_ids)
-        self.logger.debug('Enabling scanners with IDs {0}'.format(scanner_ids))
+        self._invalidate_scanner_cache()
+        if not isinstance(scanner_ids, str):
+            scanner_ids = ','.join(scanner_ids)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('Enabling scanners with IDs %s', scanner_ids)
         return self.zap.ascan.enable_scanners(scanner_ids)
 
     def disable_scanners_by_ids(self, scanner_ids):
         """Disable a list of scanner IDs."""
-        scanner_ids = ','.join(scanner_ids)
-        self.logger.debug('Disabling scanners with IDs {0}'.format(scanner_ids))
+        self._invalidate_scanner_cache()
+        if not isinstance(scanner_ids, str):
+            scanner_ids = ','.join(scanner_ids)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('Disabling scanners with IDs %s', scanner_ids)
         return self.zap.ascan.disable_scanners(scanner_ids)
 
     def enable_scanners_by_group(self, group):
@@ -240,10 +342,11 @@ class ZAPHelper(object):
         """
         if group == 'all':
             self.logger.debug('Enabling all scanners')
+            self._invalidate_scanner_cache()
             return self.zap.ascan.enable_all_scanners()
 
         try:
-            scanner_list = self.scanner_group_map[group]
+            scanner_csv = self._scanner_group_csv[group]
         except KeyError:
             raise ZAPError(
                 'Invalid group "{0}" provided. Valid groups are: {1}'.format(
@@ -252,7 +355,7 @@ class ZAPHelper(object):
             )
 
         self.logger.debug('Enabling scanner group {0}'.format(group))
-        return self.enable_scanners_by_ids(scanner_list)
+        return self.enable_scanners_by_ids(scanner_csv)
 
     def disable_scanners_by_group(self, group):
         """
@@ -260,10 +363,11 @@ class ZAPHelper(object):
         """
         if group == 'all':
             self.logger.debug('Disabling all scanners')
+            self._invalidate_scanner_cache()
             return self.zap.ascan.disable_all_scanners()
 
         try:
-            scanner_list = self.scanner_group_map[group]
+            scanner_csv = self._scanner_group_csv[group]
         except KeyError:
             raise ZAPError(
                 'Invalid group "{0}" provided. Valid groups are: {1}'.format(
@@ -272,33 +376,48 @@ class ZAPHelper(object):
             )
 
         self.logger.debug('Disabling scanner group {0}'.format(group))
-        return self.disable_scanners_by_ids(scanner_list)
+        return self.disable_scanners_by_ids(scanner_csv)
 
-    def enable_scanners(self, scanners):
-        """
-        Enable the provided scanners by group and/or IDs.
-        """
+    def _resolve_scanner_ids(self, scanners):
+        """Resolve group names and numeric IDs into a combined list of scanner IDs."""
+        groups = self._scanner_groups
+        is_scanner_id = _DIGITS_RE.match
         scanner_ids = []
+        enable_all = False
         for scanner in scanners:
-            if scanner in self.scanner_groups:
-                self.enable_scanners_by_group(scanner)
-            elif scanner.isdigit():
+            if scanner == 'all':
+                enable_all = True
+            elif scanner in groups:
+                scanner_ids.extend(self.scanner_group_map[scanner])
+            elif is_scanner_id(scanner):
                 scanner_ids.append(scanner)
             else:
                 raise ZAPError('Invalid scanner "{0}" provided. Must be a valid group or numeric ID.'.format(scanner))
 
-        if scanner_ids:
+        return enable_all, scanner_ids
+
+    def enable_scanners(self, scanners):
+        """
+        Enable the provided scanners by group and/or IDs.
+        """
+        enable_all, scanner_ids = self._resolve_scanner_ids(scanners)
+
+        if enable_all:
+            self.enable_scanners_by_group('all')
+        elif scanner_ids:
             self.enable_scanners_by_ids(scanner_ids)
 
     def disable_scanners(self, scanners):
         """
         Enable the provided scanners by group and/or IDs.
         """
+        groups = self._scanner_groups
+        is_scanner_id = _DIGITS_RE.match
         scanner_ids = []
         for scanner in scanners:
-            if scanner in self.scanner_groups:
+            if scanner in groups:
                 self.disable_scanners_by_group(scanner)
-            elif scanner.isdigit():
+            elif is_scanner_id(scanner):
                 scanner_ids.append(scanner)
             else:
                 raise ZAPError('Invalid scanner "{0}" provided. Must be a valid group or numeric ID.'.format(scanner))
@@ -311,8 +430,21 @@ class ZAPHelper(object):
         Set only the provided scanners by group and/or IDs and disable all others.
         """
         self.logger.debug('Disabling all current scanners')
-        self.zap.ascan.disable_all_scanners()
-        self.enable_scanners(scanners)
+        self._invalidate_scanner_cache()
+        disable_future = self._api_executor.submit(self.zap.ascan.disable_all_scanners)
+        try:
+            enable_all, scanner_ids = self._resolve_scanner_ids(scanners)
+        except ZAPError:
+            # Let the disable call settle without its outcome masking the
+            # invalid-token error being raised to the user.
+            concurrent.futures.wait([disable_future])
+            raise
+        disable_future.result()
+
+        if enable_all:
+            self.enable_scanners_by_group('all')
+        elif scanner_ids:
+            self.enable_scanners_by_ids(scanner_ids)
 
     def set_scanner_attack_strength(self, scanner_ids, attack_strength):
         """Set the attack strength for the given scanners."""
@@ -332,6 +464,7 @@ class ZAPHelper(object):
 
     def enable_policies_by_ids(self, policy_ids):
         """Set enabled policy from a list of IDs."""
+        self._invalidate_scanner_cache()
         policy_ids = ','.join(policy_ids)
         self.logger.debug('Setting enabled policies to IDs {0}'.format(policy_ids))
         self.zap.ascan.set_enabled_policies(policy_ids)
@@ -355,15 +488,19 @@ class ZAPHelper(object):
     def exclude_from_all(self, exclude_regex):
         """Exclude a pattern from proxy, spider and active scanner."""
         try:
-            re.compile(exclude_regex)
+            _compile_regex(exclude_regex)
         except re.error:
             raise ZAPError('Invalid regex "{0}" provided'.format(exclude_regex))
 
         self.logger.debug('Excluding {0} from proxy, spider and active scanner.'.format(exclude_regex))
 
-        self.zap.core.exclude_from_proxy(exclude_regex)
-        self.zap.spider.exclude_from_scan(exclude_regex)
-        self.zap.ascan.exclude_from_scan(exclude_regex)
+        futures = [self._api_executor.submit(exclude, exclude_regex)
+                   for exclude in (self.zap.core.exclude_from_proxy,
+                                   self.zap.spider.exclude_from_scan,
+                                   self.zap.ascan.exclude_from_scan)]
+        concurrent.futures.wait(futures)
+        for future in futures:
+            future.result()
 
     def xml_report(self, file_path):
         """Generate and save XML report"""